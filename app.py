@@ -2,7 +2,19 @@ import os
 import subprocess
 import shutil
 import json
-from fastapi import FastAPI, Form
+import time
+import asyncio
+import functools
+import contextvars
+import itertools
+import collections
+import contextlib
+import hashlib
+import threading
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, Form, Request
 from fastapi.responses import FileResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
@@ -31,6 +43,499 @@ OUTPUT_DIR = "output"
 TEMPLATE_DIR = "templates"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Each /generate call writes into its own OUTPUT_DIR/<job_id>/ directory
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+OUTPUT_RETENTION_SECONDS = float(os.getenv("OUTPUT_RETENTION_SECONDS", "3600"))
+
+def create_job_dir() -> tuple:
+    """Create a private output directory for one request; returns (job_id, path)"""
+    job_id = uuid.uuid4().hex
+    job_dir = os.path.join(OUTPUT_DIR, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    return job_id, job_dir
+
+def cleanup_old_jobs():
+    """Remove job output directories older than OUTPUT_RETENTION_SECONDS"""
+    cutoff = time.time() - OUTPUT_RETENTION_SECONDS
+    for name in os.listdir(OUTPUT_DIR):
+        job_dir = os.path.join(OUTPUT_DIR, name)
+        if JOB_ID_PATTERN.match(name) and os.path.isdir(job_dir):
+            try:
+                if os.path.getmtime(job_dir) < cutoff:
+                    shutil.rmtree(job_dir)
+                    print(f"🗑️ Cleaned up old job output: {name}")
+            except OSError:
+                pass
+
+class TenantLimitError(Exception):
+    """Raised when a tenant is over its queue or token budget"""
+
+class RequestTooLargeError(Exception):
+    """Raised when one request's estimate exceeds the whole token budget - retrying never helps"""
+
+SCHEDULER_SWEEP_INTERVAL = 60.0
+
+class FairScheduler:
+    """Weighted fair queuing of pipeline jobs per tenant (API key or IP)
+
+    Two lanes with separate slots: "llm" for full generations and "fast"
+    for cheap eligibility-only checks, so they never wait behind long LLM
+    jobs. Each lane caps per-tenant concurrency and queue length, so one
+    tenant cannot fill a lane; token budgets are shared across lanes.
+    Within a lane, the waiting job with the smallest virtual finish tag
+    (start tag + cost / tenant weight) is served first. Each lane also has
+    its own worker threads, so blocking calls never queue across lanes.
+    """
+
+    def __init__(self, slots: int, fast_slots: int, tenant_max_concurrent: int,
+                 tenant_max_concurrent_fast: int, tenant_max_queued: int,
+                 token_budget: int, budget_window: float, weights: dict = None,
+                 threads_per_llm_slot: int = 1):
+        self.slots = {"llm": slots, "fast": fast_slots}
+        self.executors = {
+            "llm": ThreadPoolExecutor(max_workers=slots * threads_per_llm_slot, thread_name_prefix="llm-lane"),
+            "fast": ThreadPoolExecutor(max_workers=fast_slots, thread_name_prefix="fast-lane"),
+        }
+        self.tenant_max_concurrent = {"llm": tenant_max_concurrent, "fast": tenant_max_concurrent_fast}
+        self.tenant_max_queued = tenant_max_queued
+        self.token_budget = token_budget
+        self.budget_window = budget_window
+        self.weights = weights or {}
+        self.running = {"llm": 0, "fast": 0}
+        self.queues = {"llm": [], "fast": []}
+        self.virtual_time = {"llm": 0.0, "fast": 0.0}
+        self.last_finish = {}
+        self.tenant_running = collections.defaultdict(int)
+        self.tenant_queued = collections.defaultdict(int)
+        self.usage = collections.defaultdict(collections.deque)
+        self.seq = itertools.count()
+        self.next_sweep = 0.0
+
+    def expire_usage(self, tenant: str, now: float):
+        usage = self.usage.get(tenant)
+        while usage and usage[0][0] <= now - self.budget_window:
+            usage.popleft()
+
+    def sweep(self):
+        """Forget tenants that are idle and whose usage window has expired"""
+        now = time.monotonic()
+        if now < self.next_sweep:
+            return
+        self.next_sweep = now + SCHEDULER_SWEEP_INTERVAL
+        tenants = set(self.usage)
+        for counters in (self.tenant_running, self.tenant_queued, self.last_finish):
+            tenants |= {tenant for _, tenant in counters}
+        for tenant in tenants:
+            self.expire_usage(tenant, now)
+            busy = any(
+                self.tenant_running.get((lane, tenant), 0) or self.tenant_queued.get((lane, tenant), 0)
+                for lane in self.slots
+            )
+            if busy or self.usage.get(tenant):
+                continue
+            self.usage.pop(tenant, None)
+            for lane in self.slots:
+                self.tenant_running.pop((lane, tenant), None)
+                self.tenant_queued.pop((lane, tenant), None)
+                self.last_finish.pop((lane, tenant), None)
+
+    def charge(self, tenant: str, tokens: int):
+        """Reserve estimated tokens against the tenant's rolling budget
+
+        Returns the reservation so it can be settled to real usage later.
+        """
+        if tokens <= 0:
+            return None
+        if tokens > self.token_budget:
+            raise RequestTooLargeError(f"Request needs ~{tokens} tokens, over the {self.token_budget} token budget")
+        now = time.monotonic()
+        self.expire_usage(tenant, now)
+        usage = self.usage[tenant]
+        used = sum(spent for _, spent in usage)
+        if used + tokens > self.token_budget:
+            retry_after = int(usage[0][0] + self.budget_window - now) + 1 if usage else int(self.budget_window)
+            raise TenantLimitError(f"Token budget exhausted ({used}/{self.token_budget}), retry in {retry_after}s")
+        reservation = [now, tokens]
+        usage.append(reservation)
+        return reservation
+
+    def settle(self, reservation: list, tokens: int):
+        """Replace a reservation's estimate with the tokens actually used"""
+        if reservation is not None:
+            reservation[1] = tokens
+
+    async def acquire(self, tenant: str, lane: str = "llm", tokens: int = 0):
+        """Wait for a slot in ``lane``; raises TenantLimitError when over quota
+
+        Returns the token reservation to pass to ``settle``.
+        """
+        self.sweep()
+        if self.tenant_queued[(lane, tenant)] >= self.tenant_max_queued:
+            raise TenantLimitError(f"Too many queued requests (max {self.tenant_max_queued})")
+        reservation = self.charge(tenant, tokens)
+
+        start_tag = max(self.virtual_time[lane], self.last_finish.get((lane, tenant), 0.0))
+        finish_tag = start_tag + max(tokens, 1) / self.weights.get(tenant, 1.0)
+        self.last_finish[(lane, tenant)] = finish_tag
+        future = asyncio.get_running_loop().create_future()
+        self.queues[lane].append((finish_tag, next(self.seq), start_tag, tenant, future))
+        self.tenant_queued[(lane, tenant)] += 1
+        self.dispatch(lane)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(tenant, lane)
+            else:
+                self.tenant_queued[(lane, tenant)] -= 1
+            self.settle(reservation, 0)
+            raise
+        return reservation
+
+    def release(self, tenant: str, lane: str = "llm"):
+        self.running[lane] -= 1
+        self.tenant_running[(lane, tenant)] -= 1
+        self.dispatch(lane)
+
+    def dispatch(self, lane: str):
+        """Grant free slots to the eligible waiting jobs with the smallest finish tags"""
+        queue = self.queues[lane]
+        while self.running[lane] < self.slots[lane]:
+            ready = [
+                job for job in queue
+                if self.tenant_running[(lane, job[3])] < self.tenant_max_concurrent[lane]
+            ]
+            if not ready:
+                break
+            job = min(ready, key=lambda job: (job[0], job[1]))
+            queue.remove(job)
+            _, _, start_tag, tenant, future = job
+            if future.cancelled():
+                continue
+            self.tenant_queued[(lane, tenant)] -= 1
+            self.running[lane] += 1
+            self.tenant_running[(lane, tenant)] += 1
+            self.virtual_time[lane] = max(self.virtual_time[lane], start_tag)
+            future.set_result(None)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, tenant: str, lane: str = "llm", tokens: int = 0):
+        """Hold a slot for the block, then settle the reservation to metered usage"""
+        meter = []
+        meter_token = TOKEN_METER.set(meter)
+        try:
+            reservation = await self.acquire(tenant, lane, tokens)
+        except BaseException:
+            TOKEN_METER.reset(meter_token)
+            raise
+        try:
+            yield
+        finally:
+            TOKEN_METER.reset(meter_token)
+            self.settle(reservation, sum(meter))
+            self.release(tenant, lane)
+
+def parse_tenant_weights(value: str) -> dict:
+    """Parse TENANT_WEIGHTS like "key1:3,key2:2" into {tenant: weight}"""
+    weights = {}
+    for item in (value or "").split(","):
+        if ":" in item:
+            tenant, weight = item.rsplit(":", 1)
+            try:
+                weight = float(weight)
+            except ValueError:
+                weight = 0.0
+            if weight > 0:
+                weights[tenant.strip()] = weight
+            else:
+                print(f"⚠️ Ignoring invalid tenant weight: {item}")
+    return weights
+
+scheduler = FairScheduler(
+    slots=int(os.getenv("SCHEDULER_SLOTS", "2")),
+    fast_slots=int(os.getenv("SCHEDULER_FAST_SLOTS", "4")),
+    tenant_max_concurrent=int(os.getenv("TENANT_MAX_CONCURRENT", "1")),
+    tenant_max_concurrent_fast=int(os.getenv("TENANT_MAX_CONCURRENT_FAST", "1")),
+    tenant_max_queued=int(os.getenv("TENANT_MAX_QUEUED", "3")),
+    token_budget=int(os.getenv("TENANT_TOKEN_BUDGET", "100000")),
+    budget_window=float(os.getenv("TENANT_BUDGET_WINDOW", "3600")),
+    weights=parse_tenant_weights(os.getenv("TENANT_WEIGHTS", "")),
+    # Widest level of the /generate task graph (rewrite, questions, skills, summary, extraction)
+    threads_per_llm_slot=5,
+)
+
+# Completion limits per subtask, used at the call sites and for budget estimates
+JD_PARSE_MAX_TOKENS = 800
+ELIGIBILITY_MAX_TOKENS = 150
+REWRITE_MAX_TOKENS = 3000
+QUESTIONS_MAX_TOKENS = 1200
+SKILLS_MAX_TOKENS = 800
+SUMMARY_MAX_TOKENS = 300
+EXTRACTION_MAX_TOKENS = 3000
+
+# One entry per completion in the /generate task graph (extraction runs twice)
+GENERATION_MAX_TOKENS = [
+    ELIGIBILITY_MAX_TOKENS, REWRITE_MAX_TOKENS, QUESTIONS_MAX_TOKENS,
+    SKILLS_MAX_TOKENS, SUMMARY_MAX_TOKENS, EXTRACTION_MAX_TOKENS, EXTRACTION_MAX_TOKENS
+]
+
+# Tokens actually used by completions in the current request; a list so worker
+# threads (which run in a copy of the context) append to the same meter
+TOKEN_METER = contextvars.ContextVar("token_meter", default=None)
+
+def estimate_generation_tokens(resume_content: str, jd_content: str) -> int:
+    """Upper-bound token reservation for one /generate call (~4 chars per token)"""
+    prompt_tokens = (len(resume_content) + len(jd_content)) // 4
+    return sum(GENERATION_MAX_TOKENS) + len(GENERATION_MAX_TOKENS) * prompt_tokens
+
+def estimate_eligibility_tokens(jd_content: str) -> int:
+    """Upper-bound token reservation for one /eligibility call"""
+    return ELIGIBILITY_MAX_TOKENS + len(jd_content) // 4
+
+async def run_blocking(fn, *args, lane: str = "llm"):
+    """Run a blocking call on the lane's worker threads, keeping the caller's context"""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        scheduler.executors[lane], functools.partial(context.run, fn, *args)
+    )
+
+# Only these X-API-Key values identify a tenant; anything else is treated as its IP
+TENANT_API_KEYS = {key.strip() for key in os.getenv("TENANT_API_KEYS", "").split(",") if key.strip()}
+
+def get_tenant_id(request: Request) -> str:
+    """Identify the caller by a configured X-API-Key, falling back to client IP"""
+    api_key = request.headers.get("x-api-key", "").strip()
+    if api_key in TENANT_API_KEYS:
+        return f"key:{api_key}"
+    if api_key:
+        print("⚠️ Unknown X-API-Key, scheduling by client IP")
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+JD_SHINGLE_SIZE = 3
+JD_NUM_HASHES = 128
+JD_LSH_BANDS = 32
+JD_HASH_RANGE = 1 << 64
+# Recency updates from lookups are flushed at most this often (and on shutdown)
+JD_INDEX_SAVE_INTERVAL = 60.0
+
+def normalize_jd(jd_content: str) -> str:
+    """Lowercase, drop URLs/emails/punctuation and collapse whitespace"""
+    text = jd_content.lower()
+    text = re.sub(r"https?://\S+|www\.\S+|\S+@\S+", " ", text)
+    text = re.sub(r"[^a-z0-9+#]+", " ", text)
+    return " ".join(text.split())
+
+# Words that make a nearby number an eligibility cut-off (matched as prefixes)
+JD_ELIGIBILITY_KEYWORDS = (
+    "cgpa", "gpa", "%", "percent", "backlog", "arrear", "batch", "year", "passout",
+    "graduat", "10th", "12th", "tenth", "twelfth", "ssc", "hsc", "experience"
+)
+JD_ELIGIBILITY_WINDOW = 4
+
+def jd_eligibility_fingerprint(jd_content: str) -> str:
+    """Hash of the eligibility-bearing tokens: the Branch: line plus numbers
+    within JD_ELIGIBILITY_WINDOW words of an eligibility keyword
+
+    Templated postings often differ only in these, so near-duplicates may
+    share parsed requirements only when this matches exactly. Other numbers
+    (posting dates, "Posted 3 days ago", salaries, phone numbers) are ignored.
+    """
+    text = re.sub(r"https?://\S+|www\.\S+|\S+@\S+", " ", jd_content.lower())
+    numbers = []
+    # Windows never cross a line or sentence, so footers stay out of the key
+    for clause in re.split(r"[\n;]|\.\s", text):
+        tokens = [token.strip(".") for token in re.findall(r"[a-z0-9.]+|%", clause)]
+        near_keyword = set()
+        for i, token in enumerate(tokens):
+            if token.startswith(JD_ELIGIBILITY_KEYWORDS):
+                near_keyword.update(range(i - JD_ELIGIBILITY_WINDOW, i + JD_ELIGIBILITY_WINDOW + 1))
+        numbers.extend(
+            token for i, token in enumerate(tokens)
+            if i in near_keyword and re.fullmatch(r"\d+(?:\.\d+)?", token)
+        )
+    branch_line = text.split("branch:", 1)[1].split("\n", 1)[0] if "branch:" in text else ""
+    key = " ".join(numbers) + "|" + normalize_jd(branch_line)
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=12).hexdigest()
+
+def jd_minhash(jd_content: str) -> list:
+    """MinHash signature over word shingles of the normalized JD
+
+    Uses one-permutation hashing (each shingle is hashed once and lands in
+    one of JD_NUM_HASHES bins) with rotation densification for empty bins,
+    so a signature costs O(shingles) instead of O(shingles * hashes).
+    """
+    words = normalize_jd(jd_content).split()
+    shingles = {
+        " ".join(words[i:i + JD_SHINGLE_SIZE])
+        for i in range(max(1, len(words) - JD_SHINGLE_SIZE + 1))
+    }
+    bin_width = JD_HASH_RANGE // JD_NUM_HASHES
+    bins = [None] * JD_NUM_HASHES
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        index, value = divmod(h, bin_width)
+        if bins[index] is None or value < bins[index]:
+            bins[index] = value
+
+    if all(value is None for value in bins):
+        return [0] * JD_NUM_HASHES
+    signature = []
+    for i in range(JD_NUM_HASHES):
+        offset = 0
+        while bins[(i + offset) % JD_NUM_HASHES] is None:
+            offset += 1
+        signature.append(bins[(i + offset) % JD_NUM_HASHES] + offset * bin_width)
+    return signature
+
+class JDIndex:
+    """Persistent MinHash/LSH index of job descriptions to cached JD profiles
+
+    Near-duplicate JDs (estimated Jaccard >= threshold over normalized word
+    shingles) with the same eligibility fingerprint share one cached
+    profile of parsed requirements and eligibility rules. Bounded to
+    ``max_entries`` with least-recently-used eviction; saved as JSON at
+    ``path``. ``lock`` guards the in-memory index only: saves snapshot it
+    under the lock and write the file outside it, so lookups never wait on disk.
+    """
+
+    def __init__(self, path: str, max_entries: int, threshold: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.rows = JD_NUM_HASHES // JD_LSH_BANDS
+        self.entries = {}
+        self.buckets = collections.defaultdict(set)
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.dirty = False
+        self.load()
+
+    def band_keys(self, signature: list) -> list:
+        return [
+            (band, tuple(signature[band * self.rows:(band + 1) * self.rows]))
+            for band in range(JD_LSH_BANDS)
+        ]
+
+    @staticmethod
+    def is_valid_entry(entry) -> bool:
+        if not isinstance(entry, dict):
+            return False
+        signature = entry.get("signature")
+        profile = entry.get("profile")
+        return (
+            isinstance(signature, list)
+            and len(signature) == JD_NUM_HASHES
+            and all(isinstance(value, int) for value in signature)
+            and isinstance(entry.get("fingerprint"), str)
+            and isinstance(profile, dict)
+            and isinstance(profile.get("requirements"), dict)
+            and isinstance(entry.get("last_used"), (int, float))
+        )
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                stored = json.load(file)
+            entries = stored.get("entries", {})
+            valid = {entry_id: entry for entry_id, entry in entries.items() if self.is_valid_entry(entry)}
+            # Keep the most recently used entries when the cap has shrunk
+            for entry_id in sorted(valid, key=lambda key: valid[key]["last_used"])[-self.max_entries:]:
+                self.add(entry_id, valid[entry_id])
+            dropped = len(entries) - len(self.entries)
+            print(f"✅ Loaded {len(self.entries)} cached JD profiles" + (f", dropped {dropped}" if dropped else ""))
+        except Exception as e:
+            print(f"❌ Ignoring unreadable JD index: {e}")
+
+    def save_if_dirty(self):
+        """Persist pending inserts and recency updates, if any"""
+        if self.dirty:
+            try:
+                self.save()
+            except Exception as e:
+                print(f"❌ Could not persist JD index: {e}")
+
+    def save(self):
+        # save_lock keeps snapshots and writes in order across threads
+        with self.save_lock:
+            with self.lock:
+                # Entries are replaced, never mutated, apart from last_used
+                snapshot = {entry_id: dict(entry) for entry_id, entry in self.entries.items()}
+                self.dirty = False
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as file:
+                    json.dump({"entries": snapshot}, file)
+                os.replace(tmp_path, self.path)
+            except Exception:
+                with self.lock:
+                    self.dirty = True
+                raise
+
+    def add(self, entry_id: str, entry: dict):
+        self.entries[entry_id] = entry
+        for key in self.band_keys(entry["signature"]):
+            self.buckets[key].add(entry_id)
+
+    def remove(self, entry_id: str):
+        entry = self.entries.pop(entry_id)
+        for key in self.band_keys(entry["signature"]):
+            self.buckets[key].discard(entry_id)
+            if not self.buckets[key]:
+                del self.buckets[key]
+
+    def lookup(self, signature: list, fingerprint: str):
+        """Return (profile, similarity) of the closest near-duplicate with the
+        same eligibility fingerprint, or (None, best similarity)"""
+        with self.lock:
+            candidates = set()
+            for key in self.band_keys(signature):
+                candidates |= self.buckets.get(key, set())
+            best_id, best_similarity = None, 0.0
+            for entry_id in candidates:
+                if self.entries[entry_id]["fingerprint"] != fingerprint:
+                    continue
+                stored = self.entries[entry_id]["signature"]
+                similarity = sum(a == b for a, b in zip(signature, stored)) / JD_NUM_HASHES
+                if similarity > best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+            if best_id is None or best_similarity < self.threshold:
+                return None, best_similarity
+            entry = self.entries[best_id]
+            # Persisted later by the periodic flush, never on the lookup path
+            entry["last_used"] = time.time()
+            self.dirty = True
+            return entry["profile"], best_similarity
+
+    def insert(self, signature: list, fingerprint: str, profile: dict):
+        with self.lock:
+            entry_id = hashlib.blake2b(f"{signature}|{fingerprint}".encode("utf-8"), digest_size=12).hexdigest()
+            if entry_id in self.entries:
+                self.remove(entry_id)
+            self.add(entry_id, {
+                "signature": signature,
+                "fingerprint": fingerprint,
+                "profile": profile,
+                "last_used": time.time()
+            })
+            while len(self.entries) > self.max_entries:
+                oldest = min(self.entries, key=lambda key: self.entries[key]["last_used"])
+                self.remove(oldest)
+                print(f"🗑️ Evicted cached JD profile {oldest}")
+            self.dirty = True
+        self.save_if_dirty()
+
+jd_index = JDIndex(
+    path=os.getenv("JD_INDEX_PATH", os.path.join("jd_cache", "jd_index.json")),
+    max_entries=int(os.getenv("JD_INDEX_MAX_ENTRIES", "500")),
+    threshold=float(os.getenv("JD_DUPLICATE_THRESHOLD", "0.8")),
+)
+
 def normalize_branch(branch: str) -> str:
     if not branch:
         return "unknown"
@@ -56,90 +561,151 @@ def normalize_branch(branch: str) -> str:
     else:
         return "other"
 
-def extract_resume_data(resume_content: str, form_data: dict):
-    """Extract structured data from resume content using AI"""
-    extraction_prompt = f"""
-Extract ONLY these details from the resume text and return as JSON:
+def extract_jd_branch(jd_content: str) -> str:
+    """Pull the normalized branch requirement out of a "Branch: ..." JD line"""
+    jd_branch = ""
+    if "branch:" in jd_content.lower():
+        try:
+            jd_branch = jd_content.split("Branch:")[1].split("\n")[0].strip()
+        except:
+            jd_branch = ""
+    return normalize_branch(jd_branch)
 
-Resume: {resume_content}
+def build_eligibility_check(tenth, twelfth, cgpa, candidate_branch, grad_year, live, dead, experience, jd_branch, jd_rules="") -> str:
+    """Eligibility instructions for the eligibility-only completion"""
+    rules = f", {jd_rules}" if jd_rules else ""
+    return f"""**STRICT ELIGIBILITY CHECK:**
+Candidate: CGPA {cgpa}, 10th: {tenth}%, 12th: {twelfth}%, Branch: {candidate_branch}, Year: {grad_year}, Backlogs: {live} live/{dead} dead, Experience: {experience}y
+JD Requirements: {jd_branch} branch requirement{rules}
 
-JSON format:
-{{
-    "full_name": "ACTUAL name from resume",
-    "email": "ACTUAL email from resume", 
-    "phone": "ACTUAL phone from resume",
-    "linkedin_url": "ACTUAL LinkedIn URL or https://linkedin.com/in/profile",
-    "github_url": "ACTUAL GitHub URL or https://github.com/username",
-    "address": "ACTUAL location from resume",
-    "professional_summary": "Strong summary based on resume skills and experience",
-    "institution_name": "ACTUAL college name from resume",
-    "education_duration": "ACTUAL dates or 2022-{form_data.get('gradYear', '2026')}",
-    "degree_program": "ACTUAL degree or B.Tech in {form_data.get('branch', 'Computer Science')}",
-    "gpa_info": "CGPA: {form_data.get('cgpa', '8.0')}/10",
-    "programming_languages": "ACTUAL languages from resume",
-    "frameworks_libraries": "ACTUAL frameworks from resume", 
-    "developer_tools": "ACTUAL tools from resume",
-    "databases_apis": "ACTUAL databases from resume",
-    "soft_skills": "ACTUAL soft skills from resume",
-    "has_experience": true if internships/jobs found else false,
-    "has_certifications": true if certifications found else false,
-    "has_extracurricular": true if activities found else false,
-    "experience": [{{
+If ineligible, return ONLY: "INELIGIBLE: [specific criteria failed]"
+"""
+
+def get_extraction_schema(form_data: dict) -> dict:
+    """JSON field specs used by the extraction prompt, keyed by resume field"""
+    return {
+        "full_name": '"ACTUAL name from resume"',
+        "email": '"ACTUAL email from resume"',
+        "phone": '"ACTUAL phone from resume"',
+        "linkedin_url": '"ACTUAL LinkedIn URL or https://linkedin.com/in/profile"',
+        "github_url": '"ACTUAL GitHub URL or https://github.com/username"',
+        "address": '"ACTUAL location from resume"',
+        "professional_summary": '"Strong summary based on resume skills and experience"',
+        "institution_name": '"ACTUAL college name from resume"',
+        "education_duration": f'"ACTUAL dates or 2022-{form_data.get("gradYear", "2026")}"',
+        "degree_program": f'"ACTUAL degree or B.Tech in {form_data.get("branch", "Computer Science")}"',
+        "gpa_info": f'"CGPA: {form_data.get("cgpa", "8.0")}/10"',
+        "programming_languages": '"ACTUAL languages from resume"',
+        "frameworks_libraries": '"ACTUAL frameworks from resume"',
+        "developer_tools": '"ACTUAL tools from resume"',
+        "databases_apis": '"ACTUAL databases from resume"',
+        "soft_skills": '"ACTUAL soft skills from resume"',
+        "has_experience": 'true if internships/jobs found else false',
+        "has_certifications": 'true if certifications found else false',
+        "has_extracurricular": 'true if activities found else false',
+        "experience": """[{
         "company_name": "Company name if found",
         "job_title": "Position title",
         "employment_duration": "Duration",
         "location": "Location",
         "responsibilities": ["Responsibility 1", "Responsibility 2"]
-    }}],
-    "certifications": [{{
+    }]""",
+        "certifications": """[{
         "name": "Certification name",
         "issuer": "Issuing organization",
         "date": "Date obtained"
-    }}],
-    "extracurricular_activities": ["Activity 1", "Achievement 2"],
-    "projects": [{{
+    }]""",
+        "extracurricular_activities": '["Activity 1", "Achievement 2"]',
+        "projects": """[{
         "title": "ACTUAL project name",
         "date": "ACTUAL date or 2024",
-        "live_demo_url": "ACTUAL URL or https://demo.com", 
+        "live_demo_url": "ACTUAL URL or https://demo.com",
         "github_url": "ACTUAL GitHub or https://github.com/user/repo",
         "bullets": ["ACTUAL description 1", "ACTUAL description 2"]
-    }}]
+    }]""",
+    }
+
+# Fields the rewrite prompt never changes - safe to extract from the original resume
+UNTOUCHED_FIELDS = [
+    "full_name", "email", "phone", "linkedin_url", "github_url", "address",
+    "institution_name", "education_duration", "degree_program", "gpa_info"
+]
+
+# Fields that must come from the rewritten resume
+REWRITTEN_FIELDS = [
+    "has_experience", "has_certifications", "has_extracurricular",
+    "experience", "certifications", "extracurricular_activities", "projects"
+]
+
+# Fields produced by the dedicated skill mapping subtask
+SKILL_FIELDS = [
+    "programming_languages", "frameworks_libraries", "developer_tools",
+    "databases_apis", "soft_skills"
+]
+
+def parse_json_response(response: str) -> dict:
+    """Strip markdown fences / chatter around a JSON object and parse it"""
+    start = response.find('{')
+    end = response.rfind('}') + 1
+    response = response[start:end] if start != -1 and end > start else response
+    return json.loads(response)
+
+def run_completion(system_prompt: str, user_prompt: str, max_tokens: int, temperature: float) -> str:
+    """Run a single chat completion and return the message text"""
+    completion = client.chat.completions.create(
+        model="openrouter/sonoma-sky-alpha",
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        max_tokens=max_tokens,
+        temperature=temperature
+    )
+    meter = TOKEN_METER.get()
+    if meter is not None:
+        usage = getattr(completion, 'usage', None)
+        total_tokens = getattr(usage, 'total_tokens', None)
+        meter.append(total_tokens if total_tokens else max_tokens + (len(system_prompt) + len(user_prompt)) // 4)
+    if hasattr(completion, 'choices') and len(completion.choices) > 0:
+        return completion.choices[0].message.content
+    raise ValueError(f"Unexpected completion format: {type(completion)}")
+
+def extract_resume_data(resume_content: str, form_data: dict, fields: list = None):
+    """Extract structured data from resume content using AI
+
+    When ``fields`` is given only those keys are requested (and returned),
+    so independent parts of the resume can be extracted concurrently.
+    """
+    schema = get_extraction_schema(form_data)
+    if fields is None:
+        fields = list(schema.keys())
+    json_format = ",\n".join(f'    "{key}": {schema[key]}' for key in fields)
+    extraction_prompt = f"""
+Extract ONLY these details from the resume text and return as JSON:
+
+Resume: {resume_content}
+
+JSON format:
+{{
+{json_format}
 }}"""
     
     try:
-        completion = client.chat.completions.create(
-            model="openrouter/sonoma-sky-alpha",  # FIXED: Removed :free
-            messages=[
-                {"role": "system", "content": "Extract ACTUAL data from resume. Return ONLY JSON."},
-                {"role": "user", "content": extraction_prompt}
-            ],
-            temperature=0,
-            max_tokens=3000
-        )
+        response = run_completion(
+            "Extract ACTUAL data from resume. Return ONLY JSON.",
+            extraction_prompt,
+            max_tokens=EXTRACTION_MAX_TOKENS,
+            temperature=0
+        ).strip()
         
-        if hasattr(completion, 'choices') and len(completion.choices) > 0:
-            response = completion.choices[0].message.content.strip()
-        else:
-            print(f"❌ Unexpected completion format: {type(completion)}")
-            return get_realistic_fallback(form_data, resume_content)
-        
-        # FIXED: Clean JSON response
-        if "```":
-            start = response.find('{')
-            end = response.rfind('}') + 1
-            response = response[start:end] if start != -1 and end > start else response
-        elif "```" in response:
-            start = response.find('{')
-            end = response.rfind('}') + 1
-            response = response[start:end] if start != -1 and end > start else response
-        
-        data = json.loads(response)
-        print("✅ Real data extracted successfully")
-        return data
+        data = parse_json_response(response)
+        print(f"✅ Real data extracted successfully ({len(fields)} fields)")
+        return {key: data[key] for key in fields if key in data}
         
     except Exception as e:
         print(f"❌ Using fallback due to: {e}")
-        return get_realistic_fallback(form_data, resume_content)
+        fallback = get_realistic_fallback(form_data, resume_content)
+        return {key: fallback[key] for key in fields if key in fallback}
 
 def get_realistic_fallback(form_data, resume_content):
     """Generate realistic fallback data when JSON extraction fails"""
@@ -395,14 +961,14 @@ def compile_latex_to_pdf(tex_file_path: str) -> str:
         print(f"❌ LaTeX compilation error: {e}")
         return None
 
-def save_simple_pdf(content: str, filename: str, title: str):
+def save_simple_pdf(content: str, filename: str, title: str, output_dir: str = OUTPUT_DIR):
     """Fallback PDF generation"""
     try:
         from reportlab.pdfgen import canvas
         from reportlab.lib.pagesizes import A4
         from reportlab.lib.utils import simpleSplit
         
-        pdf_path = os.path.join(OUTPUT_DIR, filename)
+        pdf_path = os.path.join(output_dir, filename)
         c = canvas.Canvas(pdf_path, pagesize=A4)
         width, height = A4
         
@@ -438,6 +1004,42 @@ def save_simple_pdf(content: str, filename: str, title: str):
         print(f"❌ Simple PDF error: {e}")
         return None
 
+def format_fallback_resume(resume_data: dict, resume_part: str) -> str:
+    """Plain-text resume for the ReportLab fallback
+
+    The rewrite only covers projects/experience/achievements, so the header,
+    summary, education and skills come from the merged subtask results.
+    """
+    def field(key):
+        value = resume_data.get(key)
+        return str(value).strip() if value else ""
+
+    contact = " | ".join(
+        field(key) for key in ["email", "phone", "linkedin_url", "github_url", "address"] if field(key)
+    )
+    education = ", ".join(
+        field(key) for key in ["degree_program", "institution_name", "education_duration", "gpa_info"] if field(key)
+    )
+    skills = [
+        (label, field(key)) for key, label in [
+            ("programming_languages", "Languages"),
+            ("frameworks_libraries", "Frameworks & Libraries"),
+            ("developer_tools", "Developer Tools"),
+            ("databases_apis", "Databases & APIs"),
+            ("soft_skills", "Soft Skills")
+        ] if field(key)
+    ]
+
+    sections = [field("full_name"), contact]
+    if field("professional_summary"):
+        sections.append(f"\nPROFESSIONAL SUMMARY\n{field('professional_summary')}")
+    if education:
+        sections.append(f"\nEDUCATION\n{education}")
+    if skills:
+        sections.append("\nSKILLS\n" + "\n".join(f"{label}: {value}" for label, value in skills))
+    sections.append(f"\n{resume_part.strip()}")
+    return "\n".join(section for section in sections if section)
+
 def validate_and_enhance_questions(questions_content: str, candidate_branch: str, jd_content: str) -> str:
     """Validate and enhance interview questions if they're too short"""
     
@@ -458,8 +1060,324 @@ def validate_and_enhance_questions(questions_content: str, candidate_branch: str
     
     return questions_content
 
+def parse_jd_requirements(jd_content: str) -> dict:
+    """Parse a JD into structured requirements and eligibility rules using AI"""
+    parse_prompt = f"""Extract the requirements from this job description and return as JSON:
+
+Job Description: {jd_content}
+
+JSON format:
+{{
+    "branches": "Eligible branches as written in the JD or null",
+    "min_cgpa": "Minimum CGPA or null",
+    "min_tenth": "Minimum 10th percentage or null",
+    "min_twelfth": "Minimum 12th percentage or null",
+    "max_backlogs": "Maximum allowed backlogs or null",
+    "graduation_years": "Eligible graduation years or null",
+    "experience": "Required experience or null",
+    "required_skills": ["Skill 1", "Skill 2"],
+    "preferred_skills": ["Skill 1", "Skill 2"],
+    "responsibilities": ["Responsibility 1", "Responsibility 2"]
+}}"""
+
+    response = run_completion(
+        "Extract ACTUAL requirements from the job description. Return ONLY JSON.",
+        parse_prompt,
+        max_tokens=JD_PARSE_MAX_TOKENS,
+        temperature=0
+    ).strip()
+    return parse_json_response(response)
+
+def lookup_jd_profile(jd_content: str) -> dict:
+    """Parsed requirements, normalized branch and eligibility rules for a JD
+
+    Requirements are reused from the near-duplicate JD index when a similar
+    JD with the same eligibility fingerprint was seen before. On a miss the
+    profile carries no requirements and prompts fall back to the raw JD;
+    ``schedule_jd_indexing`` parses and stores it in the background. The
+    branch is always taken from this JD's own "Branch:" line.
+    """
+    started = time.perf_counter()
+    signature = jd_minhash(jd_content)
+    fingerprint = jd_eligibility_fingerprint(jd_content)
+    cached, similarity = jd_index.lookup(signature, fingerprint)
+    lookup_ms = (time.perf_counter() - started) * 1000
+    requirements = cached["requirements"] if cached is not None else None
+    if cached is not None:
+        print(f"♻️ Reusing parsed JD (similarity {similarity:.2f}, lookup {lookup_ms:.2f}ms)")
+    else:
+        print(f"🔍 No near-duplicate JD (lookup {lookup_ms:.2f}ms)")
+
+    jd_branch = extract_jd_branch(jd_content)
+    if jd_branch == "unknown" and requirements and requirements.get("branches"):
+        jd_branch = normalize_branch(str(requirements["branches"]))
+    return {
+        "jd_branch": jd_branch,
+        "requirements": requirements,
+        "cached": cached is not None,
+        "signature": signature,
+        "fingerprint": fingerprint
+    }
+
+def index_jd_profile(jd_content: str, jd_profile: dict):
+    """Parse a JD that missed the index and store it for near-duplicates
+
+    Failed parses are not cached.
+    """
+    if jd_profile["cached"]:
+        return
+    try:
+        requirements = parse_jd_requirements(jd_content)
+    except Exception as e:
+        print(f"❌ JD parse failed, not indexed: {e}")
+        return
+    jd_index.insert(jd_profile["signature"], jd_profile["fingerprint"], {"requirements": requirements})
+    print("✅ Parsed and indexed JD")
+
+# JD parses for the index run on their own thread, outside any request: they
+# never hold a lane slot, never delay a response and are not billed to a tenant
+JD_INDEX_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jd-index")
+JD_INDEX_MAX_PENDING = 16
+jd_index_pending = set()
+jd_index_pending_lock = threading.Lock()
+
+def schedule_jd_indexing(jd_content: str, jd_profile: dict):
+    """Queue a background parse for a JD that missed the index
+
+    Identical JDs already waiting are skipped, as is everything once the
+    queue is full; the next request for that JD schedules it again.
+    """
+    if jd_profile["cached"]:
+        return
+    key = (tuple(jd_profile["signature"]), jd_profile["fingerprint"])
+    with jd_index_pending_lock:
+        if key in jd_index_pending or len(jd_index_pending) >= JD_INDEX_MAX_PENDING:
+            return
+        jd_index_pending.add(key)
+
+    def run():
+        try:
+            index_jd_profile(jd_content, jd_profile)
+        finally:
+            with jd_index_pending_lock:
+                jd_index_pending.discard(key)
+
+    JD_INDEX_EXECUTOR.submit(run)
+
+ELIGIBILITY_RULE_FIELDS = [
+    ("min_cgpa", "Min CGPA"), ("min_tenth", "Min 10th"), ("min_twelfth", "Min 12th"),
+    ("max_backlogs", "Max Backlogs"), ("graduation_years", "Graduation Years"),
+    ("experience", "Experience")
+]
+
+def format_eligibility_rules(profile: dict) -> str:
+    requirements = profile.get("requirements") or {}
+    return ", ".join(
+        f"{label}: {requirements[key]}"
+        for key, label in ELIGIBILITY_RULE_FIELDS
+        if requirements.get(key) not in (None, "", "null")
+    )
+
+def format_jd_digest(profile: dict, jd_content: str) -> str:
+    """Compact JD text for prompts - the parsed requirements, or the raw JD
+
+    Cached requirements may come from a near-duplicate posting, so the title
+    always comes from this JD's own first line.
+    """
+    requirements = profile.get("requirements")
+    if not requirements:
+        return jd_content
+
+    def join(values):
+        return ", ".join(str(value) for value in values) if isinstance(values, list) else str(values or "")
+
+    title = next((line.strip() for line in jd_content.splitlines() if line.strip()), "")
+    return f"""Posting: {title}
+Required Skills: {join(requirements.get('required_skills'))}
+Preferred Skills: {join(requirements.get('preferred_skills'))}
+Responsibilities: {join(requirements.get('responsibilities'))}
+Eligibility: {format_eligibility_rules(profile) or 'Not specified'}"""
+
+def is_ineligible(output: str) -> bool:
+    """Check whether the eligibility completion rejected the candidate"""
+    return output.lower().startswith("ineligible") or "not eligible" in output.lower()[:200]
+
+def check_candidate_eligibility(candidate: dict, jd_profile: dict, jd_content: str) -> str:
+    """Short eligibility-only completion; returns "ELIGIBLE" or "INELIGIBLE: ..." text"""
+    eligibility_check = build_eligibility_check(
+        candidate.get('tenth', ''), candidate.get('twelfth', ''), candidate.get('cgpa', ''),
+        normalize_branch(candidate.get('branch', '')), candidate.get('gradYear', ''),
+        candidate.get('live', ''), candidate.get('dead', ''), candidate.get('experience', ''),
+        jd_profile["jd_branch"], format_eligibility_rules(jd_profile)
+    )
+    prompt = f"""{eligibility_check}
+
+If eligible, return ONLY: "ELIGIBLE"
+
+Job Description: {format_jd_digest(jd_profile, jd_content)}"""
+
+    output = run_completion(
+        "You are a strict eligibility checker.",
+        prompt,
+        max_tokens=ELIGIBILITY_MAX_TOKENS,
+        temperature=0
+    ).strip()
+    print(f"✅ Eligibility check: {output[:80]}")
+    return output
+
+def generate_interview_questions(resume_content: str, jd_content: str, candidate_branch: str) -> str:
+    """Generate 5 interview questions from the JD and the ORIGINAL resume"""
+    questions_prompt = f"""You are an expert technical interviewer.
+
+Write exactly 5 challenging, role-specific interview questions for this candidate:
+1. [Technical deep-dive question on primary JD technology with specific coding scenario]
+2. [System design question combining candidate's project experience with JD architecture requirements]
+3. [Complex debugging/problem-solving scenario relevant to JD tech stack]
+4. [Scalability/performance question using JD technologies and frameworks]
+5. [Behavioral leadership question: team conflict, project delivery, mentoring scenario]
+
+Candidate Branch: {candidate_branch}
+
+Candidate Resume: {resume_content}
+
+Job Description: {jd_content}
+
+Return ONLY the 5 numbered questions."""
+
+    try:
+        questions_part = run_completion(
+            "You are a technical interviewer. Return exactly 5 numbered interview questions.",
+            questions_prompt,
+            max_tokens=QUESTIONS_MAX_TOKENS,
+            temperature=0.7
+        ).strip()
+        print(f"✅ Generated {len(questions_part)} chars of questions")
+    except Exception as e:
+        print(f"❌ Question generation failed: {e}")
+        questions_part = ""
+    
+    if len(questions_part) > 100:
+        return f"Interview Questions:\n\n{questions_part}"
+    print("🔄 Using enhanced fallback questions")
+    return validate_and_enhance_questions("", candidate_branch, jd_content)
+
+def map_skills_to_jd(resume_content: str, jd_content: str, form_data: dict) -> dict:
+    """Map candidate skills onto JD keywords, returning the skill fields only"""
+    schema = get_extraction_schema(form_data)
+    json_format = ",\n".join(f'    "{key}": {schema[key]}' for key in SKILL_FIELDS)
+    skills_prompt = f"""Map the candidate's skills to the job description and return as JSON.
+
+- Transform candidate skills to match JD keywords exactly where they are equivalent
+- Put skills mentioned in the JD first
+- Comma-separated values only
+
+Candidate Resume: {resume_content}
+
+Job Description: {jd_content}
+
+JSON format:
+{{
+{json_format}
+}}"""
+
+    try:
+        response = run_completion(
+            "You are an ATS skills mapper. Return ONLY JSON.",
+            skills_prompt,
+            max_tokens=SKILLS_MAX_TOKENS,
+            temperature=0
+        ).strip()
+        data = parse_json_response(response)
+        print("✅ Skills mapped to JD")
+        return {key: data[key] for key in SKILL_FIELDS if key in data}
+    except Exception as e:
+        print(f"❌ Using fallback skills due to: {e}")
+        fallback = get_realistic_fallback(form_data, resume_content)
+        return {key: fallback[key] for key in SKILL_FIELDS}
+
+def write_professional_summary(resume_content: str, jd_content: str, form_data: dict) -> str:
+    """Write a 3-4 line JD-targeted professional summary"""
+    summary_prompt = f"""Write a 3-4 line professional summary for this candidate highlighting JD-relevant skills and experience.
+
+Candidate Resume: {resume_content}
+
+Job Description: {jd_content}
+
+Return ONLY the summary text."""
+
+    try:
+        summary = run_completion(
+            "You are an expert ATS resume writer.",
+            summary_prompt,
+            max_tokens=SUMMARY_MAX_TOKENS,
+            temperature=0.7
+        ).strip()
+        if summary:
+            print("✅ Professional summary written")
+            return summary
+    except Exception as e:
+        print(f"❌ Summary generation failed: {e}")
+    return get_realistic_fallback(form_data, resume_content)["professional_summary"]
+
+async def run_task_graph(tasks: dict):
+    """Run blocking subtasks concurrently, honouring their dependencies
+
+    ``tasks`` maps a task name to ``(dependencies, fn)``; ``fn`` is called in a
+    worker thread with the results of its dependencies as positional arguments.
+    Returns the results per task and a timing report with the critical path.
+    """
+    t0 = time.perf_counter()
+    futures = {}
+    timings = {}
+
+    async def run(name):
+        deps, fn = tasks[name]
+        dep_results = [await futures[dep] for dep in deps]
+        started = time.perf_counter()
+        result = await run_blocking(fn, *dep_results)
+        timings[name] = (started - t0, time.perf_counter() - t0)
+        return result
+
+    for name in tasks:
+        futures[name] = asyncio.ensure_future(run(name))
+    # Let every started subtask finish before failing, so the caller's slot and
+    # token meter still cover all completions this request started
+    outcomes = await asyncio.gather(*futures.values(), return_exceptions=True)
+    for outcome in outcomes:
+        if isinstance(outcome, Exception):
+            raise outcome
+    results = dict(zip(futures.keys(), outcomes))
+    wall_clock = time.perf_counter() - t0
+
+    # Longest dependency chain by measured duration
+    durations = {name: end - start for name, (start, end) in timings.items()}
+    chain = {}
+    for name in sorted(timings, key=lambda name: timings[name][1]):
+        deps = tasks[name][0]
+        prev = max(deps, key=lambda dep: chain[dep][0]) if deps else None
+        length = durations[name] + (chain[prev][0] if prev else 0)
+        chain[name] = (length, (chain[prev][1] if prev else []) + [name])
+    critical_name = max(chain, key=lambda name: chain[name][0])
+    sequential = sum(durations.values())
+
+    report = {
+        "tasks": {
+            name: {"start_ms": round(start * 1000), "duration_ms": round((end - start) * 1000)}
+            for name, (start, end) in timings.items()
+        },
+        "critical_path": chain[critical_name][1],
+        "critical_path_ms": round(chain[critical_name][0] * 1000),
+        "wall_clock_ms": round(wall_clock * 1000),
+        "sequential_ms": round(sequential * 1000),
+        "saved_ms": round((sequential - wall_clock) * 1000),
+    }
+    print(f"⏱️ Pipeline: {report['wall_clock_ms']}ms wall-clock vs {report['sequential_ms']}ms sequential "
+          f"(critical path: {' → '.join(report['critical_path'])})")
+    return results, report
+
 @app.post("/generate")
 async def generate_resume(
+    request: Request,
     resume: str = Form(...),
     jd: str = Form(...),
     tenth: str = Form(""),
@@ -472,241 +1390,266 @@ async def generate_resume(
     experience: str = Form(""),
     gradYear: str = Form("")
 ):
+    tenant = get_tenant_id(request)
     try:
-        print("🚀 Starting resume generation...")
-        
-        # FIXED: Clean old PDFs - more comprehensive
-        def cleanup_old_pdfs():
-            old_files = [
-                "ATS_Professional_Resume.pdf",
-                "Professional_Resume.pdf",
-                "Fallback_Resume.pdf", 
-                "Updated_Resume.pdf",
-                "resume.pdf"
-            ]
-            for filename in old_files:
-                file_path = os.path.join(OUTPUT_DIR, filename)
-                if os.path.exists(file_path):
-                    try:
-                        os.remove(file_path)
-                        print(f"🗑️ Cleaned up old file: {filename}")
-                    except:
-                        pass
+        async with scheduler.slot(tenant, "llm", tokens=estimate_generation_tokens(resume, jd)):
+            print(f"🚀 Starting resume generation for {tenant}...")
         
-        cleanup_old_pdfs()
+            # Per-request output directory so concurrent requests never share files
+            cleanup_old_jobs()
+            job_id, job_dir = create_job_dir()
         
-        # AI processing for eligibility and tailoring
-        candidate_branch_norm = normalize_branch(branch)
-        jd_branch = ""
-        jd_lower = jd.lower()
-        if "branch:" in jd_lower:
-            try:
-                jd_branch = jd.split("Branch:")[1].split("\n")[0].strip()
-            except:
-                jd_branch = ""
-        
-        jd_branch_norm = normalize_branch(jd_branch)
-        extra_info = f"""
+            # AI processing for eligibility and tailoring
+            candidate_branch_norm = normalize_branch(branch)
+
+            form_data = {
+                'tenth': tenth, 'twelfth': twelfth, 'cgpa': cgpa, 
+                'branch': branch, 'gradYear': gradYear
+            }
+            candidate = dict(form_data, live=live, dead=dead, experience=experience)
+
+            def rewrite_resume(jd_profile):
+                jd_branch_norm = jd_profile["jd_branch"]
+                extra_info = f"""
 Candidate Info: 10th: {tenth}%, 12th: {twelfth}%, CGPA: {cgpa}, Branch: {candidate_branch_norm}, Year: {gradYear}, Gap: {gap}, Live Backlogs: {live}, Dead Backlogs: {dead}, Experience: {experience} years
 JD Branch: {jd_branch_norm}
 """
 
-        # ENHANCED: Better prompt for interview questions
-        prompt = f"""You are an expert ATS resume writer and technical interviewer.
-
-**STRICT ELIGIBILITY CHECK:**
-Candidate: CGPA {cgpa}, 10th: {tenth}%, 12th: {twelfth}%, Branch: {candidate_branch_norm}, Year: {gradYear}, Backlogs: {live} live/{dead} dead, Experience: {experience}y
-JD Requirements: {jd_branch_norm} branch requirement
-
-If ineligible, return ONLY: "INELIGIBLE: [specific criteria failed]"
-
-**RESUME REWRITING REQUIREMENTS (if eligible):**
-1. **Skills Mapping**: Transform candidate skills to match JD exactly
-   - Java → Python, React → Angular, MySQL → PostgreSQL
-   - Use JD keywords naturally throughout resume
+                # Rewrite prompt: section rewriting only. Eligibility is checked first;
+                # questions, skills, summary and untouched fields run alongside it.
+                prompt = f"""You are an expert ATS resume writer.
 
-2. **Project Enhancement**: Reframe projects with quantified impact
+**RESUME REWRITING REQUIREMENTS:**
+1. **Project Enhancement**: Reframe projects with quantified impact
    - "Improved performance by X%", "Built system handling Y users"
    - Emphasize technologies mentioned in JD
    - NO duplication across sections
 
-3. **ATS Optimization**: 
-   - Use standard section headers: Summary, Education, Skills, Projects, Experience
+2. **ATS Optimization**: 
+   - Use standard section headers: Education, Projects, Experience, Achievements
    - Include relevant keywords from JD in appropriate sections
    - Quantify all achievements with numbers/metrics
 
-4. **Professional Summary**: Write 3-4 lines highlighting JD-relevant skills and experience
-
-5. **Section Organization**:
+3. **Section Organization**:
    - Projects go ONLY in Projects section
    - Work experience goes ONLY in Experience section  
    - Achievements go ONLY in Achievements section
    - NO content duplication between sections
 
-**MANDATORY OUTPUT FORMAT:**
-End response with exactly this structure:
-
----RESUME CONTENT ABOVE---
-
-INTERVIEW QUESTIONS:
-1. [Technical deep-dive question on primary JD technology with specific coding scenario]
-2. [System design question combining candidate's project experience with JD architecture requirements]
-3. [Complex debugging/problem-solving scenario relevant to JD tech stack]
-4. [Scalability/performance question using JD technologies and frameworks]
-5. [Behavioral leadership question: team conflict, project delivery, mentoring scenario]
-
 **INPUT DATA:**
 Candidate Resume: {resume}
 
-Job Description: {jd}
+Job Description: {format_jd_digest(jd_profile, jd)}
 
 Academic Details: {extra_info}
 
 **INSTRUCTIONS:**
 - Generate professional, ATS-optimized resume content
 - Ensure each section has unique, non-duplicated content
-- Create exactly 5 challenging, role-specific interview questions
 - Use quantifiable achievements and JD keywords throughout
-- Make content compelling and interview-ready
+- Do NOT write a summary, skills section or interview questions
 
-Generate the complete resume rewrite with exactly 5 detailed interview questions."""
+Generate the rewritten resume sections."""
 
-
-        try:
-            completion = client.chat.completions.create(
-                model="openrouter/sonoma-sky-alpha",
-                messages=[
-                    {"role": "system", "content": "You are a resume assistant. You MUST end every response with exactly 5 numbered INTERVIEW QUESTIONS. This is mandatory."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=4000,
-                temperature=0.7
-            )
-            
-            if hasattr(completion, 'choices') and len(completion.choices) > 0:
-                output = completion.choices[0].message.content
+                output = run_completion(
+                    "You are a resume assistant.",
+                    prompt,
+                    max_tokens=REWRITE_MAX_TOKENS,
+                    temperature=0.7
+                )
                 print(f"✅ AI processing complete - {len(output)} characters")
                 print(f"🔍 Raw output preview: {output[:200]}...")
-            else:
-                print(f"❌ Unexpected completion format: {type(completion)}")
-                return JSONResponse({"error": "AI response failed"}, status_code=500)
-                
-        except Exception as api_error:
-            print(f"💥 API Error: {api_error}")
-            return JSONResponse({"error": f"API Error: {str(api_error)}"}, status_code=500)
-        
-        # Handle ineligibility
-        if output.lower().startswith("ineligible") or "not eligible" in output.lower()[:200]:
-            note_pdf = "Eligibility_Note.pdf"
-            save_simple_pdf(output, note_pdf, "Eligibility Result")
-            return JSONResponse({
-                "resume_pdf_url": f"/download/{note_pdf}",
-                "questions_pdf_url": None
-            })
+                return output
 
-        # ENHANCED: Question extraction with better validation
-        questions_content = ""
-        separators = ["INTERVIEW QUESTIONS:", "Interview Questions:", "QUESTIONS:", "Questions:"]
-        resume_part = output
-        
-        for separator in separators:
-            if separator in output:
-                parts = output.split(separator, 1)
-                if len(parts) == 2:
-                    resume_part = parts[0].strip()
-                    questions_part = parts[1].strip()
-                    
-                    # Validate questions content length
-                    if len(questions_part) > 100:
-                        questions_content = f"Interview Questions:\n\n{questions_part}"
-                        print(f"✅ Found {len(questions_part)} chars of questions using '{separator}'")
-                    else:
-                        print(f"⚠️ Questions too short: {len(questions_part)} chars")
-                        questions_content = validate_and_enhance_questions("", candidate_branch_norm, jd)
-                    break
-        
-        # Fallback if no questions found
-        if not questions_content or len(questions_content) < 100:
-            print("🔄 Using enhanced fallback questions")
-            questions_content = validate_and_enhance_questions("", candidate_branch_norm, jd)
-        
-        print(f"📝 Resume part: {len(resume_part)} chars")
-        print(f"❓ Final questions: {len(questions_content)} chars")
-
-        # MAIN LATEX PIPELINE
-        form_data = {
-            'tenth': tenth, 'twelfth': twelfth, 'cgpa': cgpa, 
-            'branch': branch, 'gradYear': gradYear
-        }
+            def if_eligible(fn):
+                # Skip paid subtasks once the eligibility gate rejects the candidate
+                def run(eligibility, *dep_results):
+                    return None if is_ineligible(eligibility) else fn(*dep_results)
+                return run
+
+            def extract_rewritten_sections(output):
+                if output is None:
+                    return None
+                return extract_resume_data(output.strip(), form_data, REWRITTEN_FIELDS)
+
+            print("🔄 Step 1: Running generation subtasks...")
+            try:
+                results, pipeline_report = await run_task_graph({
+                    "jd_profile": ([], lambda: lookup_jd_profile(jd)),
+                    "eligibility": (["jd_profile"], lambda profile: check_candidate_eligibility(candidate, profile, jd)),
+                    "rewrite": (["eligibility", "jd_profile"], if_eligible(rewrite_resume)),
+                    "questions": (["eligibility", "jd_profile"], if_eligible(lambda profile: generate_interview_questions(
+                        resume, format_jd_digest(profile, jd), candidate_branch_norm))),
+                    "skills": (["eligibility", "jd_profile"], if_eligible(lambda profile: map_skills_to_jd(
+                        resume, format_jd_digest(profile, jd), form_data))),
+                    "summary": (["eligibility", "jd_profile"], if_eligible(lambda profile: write_professional_summary(
+                        resume, format_jd_digest(profile, jd), form_data))),
+                    "untouched_fields": (["eligibility"], if_eligible(
+                        lambda: extract_resume_data(resume, form_data, UNTOUCHED_FIELDS))),
+                    "rewritten_fields": (["rewrite"], extract_rewritten_sections),
+                })
+            except Exception as api_error:
+                print(f"💥 API Error: {api_error}")
+                return JSONResponse({"error": f"API Error: {str(api_error)}"}, status_code=500)
+
+            pipeline_report["jd_cache_hit"] = results["jd_profile"]["cached"]
+            eligibility = results["eligibility"]
+            if not is_ineligible(eligibility):
+                # On a miss this request used the raw JD; index it for the next one
+                schedule_jd_indexing(jd, results["jd_profile"])
+        
+            # Handle ineligibility
+            if is_ineligible(eligibility):
+                note_pdf = "Eligibility_Note.pdf"
+                save_simple_pdf(eligibility, note_pdf, "Eligibility Result", job_dir)
+                return JSONResponse({
+                    "resume_pdf_url": f"/download/{job_id}/{note_pdf}",
+                    "questions_pdf_url": None,
+                    "pipeline": pipeline_report
+                })
+
+            resume_part = results["rewrite"].strip()
+            questions_content = results["questions"]
         
-        print("🔄 Step 1: Extracting structured data...")
-        resume_data = extract_resume_data(resume_part, form_data)
+            print(f"📝 Resume part: {len(resume_part)} chars")
+            print(f"❓ Final questions: {len(questions_content)} chars")
+
+            # MAIN LATEX PIPELINE - merge subtask results
+            resume_data = {}
+            resume_data.update(results["untouched_fields"])
+            resume_data.update(results["skills"])
+            resume_data["professional_summary"] = results["summary"]
+            resume_data.update(results["rewritten_fields"])
         
-        template_path = os.path.join(TEMPLATE_DIR, "main.tex")
-        output_tex_path = os.path.join(OUTPUT_DIR, "resume.tex")
+            template_path = os.path.join(TEMPLATE_DIR, "main.tex")
+            output_tex_path = os.path.join(job_dir, "resume.tex")
         
-        print(f"🔄 Step 2: Template path: {template_path}")
+            print(f"🔄 Step 2: Template path: {template_path}")
         
-        if populate_latex_template(template_path, resume_data, output_tex_path):
-            print("🔄 Step 3: Compiling LaTeX...")
+            if populate_latex_template(template_path, resume_data, output_tex_path):
+                print("🔄 Step 3: Compiling LaTeX...")
             
-            pdf_path = None
-            for attempt in range(3):
-                print(f"🔄 LaTeX compilation attempt {attempt + 1}/3")
-                pdf_path = compile_latex_to_pdf(output_tex_path)
-                if pdf_path:
-                    break
-                elif attempt < 2:
-                    print("⏳ Retrying in 1 second...")
-                    import time
-                    time.sleep(1)
+                pdf_path = None
+                for attempt in range(3):
+                    print(f"🔄 LaTeX compilation attempt {attempt + 1}/3")
+                    pdf_path = await run_blocking(compile_latex_to_pdf, output_tex_path)
+                    if pdf_path:
+                        break
+                    elif attempt < 2:
+                        print("⏳ Retrying in 1 second...")
+                        await asyncio.sleep(1)
             
-            if pdf_path:
-                # FIXED: Only create ONE resume file with consistent naming
-                final_resume_name = "Professional_Resume.pdf"
-                final_pdf_path = os.path.join(OUTPUT_DIR, final_resume_name)
+                if pdf_path:
+                    # FIXED: Only create ONE resume file with consistent naming
+                    final_resume_name = "Professional_Resume.pdf"
+                    final_pdf_path = os.path.join(job_dir, final_resume_name)
                 
-                # Use move to avoid duplicates
-                if os.path.exists(pdf_path):
-                    shutil.move(pdf_path, final_pdf_path)
+                    # Use move to avoid duplicates
+                    if os.path.exists(pdf_path):
+                        shutil.move(pdf_path, final_pdf_path)
                 
-                # Generate questions PDF
-                questions_pdf_name = "Interview_Questions.pdf"
-                save_simple_pdf(questions_content, questions_pdf_name, "Technical Interview Questions")
+                    # Generate questions PDF
+                    questions_pdf_name = "Interview_Questions.pdf"
+                    save_simple_pdf(questions_content, questions_pdf_name, "Technical Interview Questions", job_dir)
                 
-                print("🎉 SUCCESS: Single professional resume generated!")
-                print(f"📄 Resume: {final_resume_name}")
-                print(f"❓ Questions: {questions_pdf_name}")
+                    print("🎉 SUCCESS: Single professional resume generated!")
+                    print(f"📄 Resume: {final_resume_name}")
+                    print(f"❓ Questions: {questions_pdf_name}")
                 
-                return JSONResponse({
-                    "resume_pdf_url": f"/download/{final_resume_name}",
-                    "questions_pdf_url": f"/download/{questions_pdf_name}"
-                })
-            else:
-                print("⚠️ LaTeX failed, using fallback...")
-                resume_pdf_name = "Resume_Fallback.pdf"
-                save_simple_pdf(resume_part.strip(), resume_pdf_name, "Updated Resume")
-                questions_pdf_name = "Interview_Questions.pdf"
-                save_simple_pdf(questions_content, questions_pdf_name, "Technical Interview Questions")
+                    return JSONResponse({
+                        "resume_pdf_url": f"/download/{job_id}/{final_resume_name}",
+                        "questions_pdf_url": f"/download/{job_id}/{questions_pdf_name}",
+                        "pipeline": pipeline_report
+                    })
+                else:
+                    print("⚠️ LaTeX failed, using fallback...")
+                    resume_pdf_name = "Resume_Fallback.pdf"
+                    save_simple_pdf(format_fallback_resume(resume_data, resume_part), resume_pdf_name, "Updated Resume", job_dir)
+                    questions_pdf_name = "Interview_Questions.pdf"
+                    save_simple_pdf(questions_content, questions_pdf_name, "Technical Interview Questions", job_dir)
                 
-                return JSONResponse({
-                    "resume_pdf_url": f"/download/{resume_pdf_name}", 
-                    "questions_pdf_url": f"/download/{questions_pdf_name}"
-                })
-        else:
-            return JSONResponse({"error": "Template population failed"}, status_code=500)
+                    return JSONResponse({
+                        "resume_pdf_url": f"/download/{job_id}/{resume_pdf_name}", 
+                        "questions_pdf_url": f"/download/{job_id}/{questions_pdf_name}",
+                        "pipeline": pipeline_report
+                    })
+            else:
+                return JSONResponse({"error": "Template population failed"}, status_code=500)
         
+    except RequestTooLargeError as size_error:
+        print(f"🚦 Rejected {tenant}: {size_error}")
+        return JSONResponse({"error": str(size_error)}, status_code=413)
+    except TenantLimitError as limit_error:
+        print(f"🚦 Rejected {tenant}: {limit_error}")
+        return JSONResponse({"error": str(limit_error)}, status_code=429)
     except Exception as e:
         print(f"💥 Error: {str(e)}")
         return JSONResponse({"error": str(e)}, status_code=500)
 
-@app.get("/download/{filename}")
-async def download_file(filename: str):
-    file_path = os.path.join(OUTPUT_DIR, filename)
+@app.post("/eligibility")
+async def check_eligibility(
+    request: Request,
+    jd: str = Form(...),
+    tenth: str = Form(""),
+    twelfth: str = Form(""),
+    cgpa: str = Form(""),
+    branch: str = Form(""),
+    live: str = Form(""),
+    dead: str = Form(""),
+    experience: str = Form(""),
+    gradYear: str = Form("")
+):
+    """Eligibility-only check - served from the scheduler's fast lane"""
+    tenant = get_tenant_id(request)
+
+    try:
+        async with scheduler.slot(tenant, "fast", tokens=estimate_eligibility_tokens(jd)):
+            jd_profile = await run_blocking(lookup_jd_profile, jd, lane="fast")
+            candidate = {
+                'tenth': tenth, 'twelfth': twelfth, 'cgpa': cgpa, 'branch': branch,
+                'gradYear': gradYear, 'live': live, 'dead': dead, 'experience': experience
+            }
+            output = await run_blocking(check_candidate_eligibility, candidate, jd_profile, jd, lane="fast")
+    except RequestTooLargeError as size_error:
+        return JSONResponse({"error": str(size_error)}, status_code=413)
+    except TenantLimitError as limit_error:
+        return JSONResponse({"error": str(limit_error)}, status_code=429)
+    except Exception as e:
+        print(f"💥 Eligibility Error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+    return JSONResponse({"eligible": not is_ineligible(output), "reason": output})
+
+@app.get("/download/{job_id}/{filename}")
+async def download_file(job_id: str, filename: str):
+    if not JOB_ID_PATTERN.match(job_id) or filename != os.path.basename(filename):
+        return JSONResponse({"error": "File not found"}, status_code=404)
+    file_path = os.path.join(OUTPUT_DIR, job_id, filename)
+    # Cached render - plain file serving, not scheduled, so never waits behind LLM jobs
     if os.path.exists(file_path):
         return FileResponse(file_path, media_type="application/pdf", filename=filename)
     return JSONResponse({"error": "File not found"}, status_code=404)
 
+async def flush_jd_index():
+    """Persist JD index recency updates every JD_INDEX_SAVE_INTERVAL seconds"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(JD_INDEX_SAVE_INTERVAL)
+        await loop.run_in_executor(JD_INDEX_EXECUTOR, jd_index.save_if_dirty)
+
+jd_index_flusher = None
+
+@app.on_event("startup")
+async def start_jd_index_flusher():
+    global jd_index_flusher
+    jd_index_flusher = asyncio.create_task(flush_jd_index())
+
+@app.on_event("shutdown")
+def save_jd_index():
+    if jd_index_flusher is not None:
+        jd_index_flusher.cancel()
+    jd_index.save_if_dirty()
+
 # Serve frontend
 app.mount("/static", StaticFiles(directory="front"), name="static")
 